@@ -1,11 +1,11 @@
 import random
-import numpy as np
+from ExplorationSchedule import exploration_schedule
 
 
 class Agent:
     """Agent class capable of playing a prisoners dilemma game with opponents"""
 
-    def __init__(self, sim_data, location=(0, 0)):
+    def __init__(self, sim_data, location=(0, 0), schedule=None):
         self.neighbours = []
         self.actions = sim_data["actions"]
         # currently selected choice is initialised randomly to start
@@ -15,13 +15,17 @@ class Agent:
 
         # initialisation of variables
         self.exploration_rate = sim_data["exploration_rate"]
-        self.exploration_decay = sim_data["exploration_decay"]
+        # societies pass the schedule they share with all their agents, so it is only looked up once
+        self.exploration_schedule = schedule if schedule is not None else exploration_schedule(sim_data)
         self.exploration_update = sim_data["exploration_update"]
+        # number of times the agent has selected an action, used to calculate the exploration rate
+        self.plays = 0
 
         self.social_value = sim_data["initial_social_value"]
         if sim_data["random_social_value"]:
-            self.social_value = np.random.normal(sim_data["initial_social_value"], sim_data["std_dev"])
+            self.social_value = random.gauss(sim_data["initial_social_value"], sim_data["std_dev"])
         self.played = False
+        # location on the screen, agents of a society have None until the society has placed them
         self.location = location
         self.social_adjustment = sim_data["social_adjustment"]
         self.beta = sim_data["social_step_size"]
@@ -93,10 +97,11 @@ class Agent:
         """ function to poll action of agent, agent will store action as it's last action for society to see"""
         # This variable is to see if this agent has already played a game and is important for the society
         self.played = True
+        self.plays += 1
 
-        # exploration rate is updated here
+        # exploration rate is calculated from the number of plays here
         if self.exploration_update:
-            self.exploration_rate *= self.exploration_decay
+            self.exploration_rate = self.exploration_schedule.rate(self.plays)
 
         # epsilon greedy action selection is employed to select action
         rand = random.uniform(0, 1)
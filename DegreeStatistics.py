@@ -0,0 +1,91 @@
+import numpy as np
+
+
+def power_of_two_bins(num_agents):
+    """creates bin edges grouping agents into node classes by their number of neighbours, the classes are
+    0, 1, 2-3, 4-7, ... and the last class also contains all agents with more neighbours"""
+    edges = [0]
+    degree = 1
+    while degree < num_agents:
+        edges.append(degree)
+        degree *= 2
+    return np.array(edges)
+
+
+class DegreeStatistics:
+    """DegreeStatistics class accumulating the cooperation rate and social value of agents grouped by their number of
+    neighbours over many iterations. Means and variances are updated in a streaming way, so no per iteration data
+    has to be kept"""
+
+    def __init__(self, bin_edges=None):
+        # without bin edges every number of neighbours is its own bin
+        self.bin_edges = bin_edges
+
+        # number of iterations in which each bin contained agents and the total number of agents seen in each bin
+        self.samples = np.zeros(0, dtype=np.int64)
+        self.agents = np.zeros(0, dtype=np.int64)
+
+        # running means and sums of squared differences from the mean for each bin
+        self.coop_mean = np.zeros(0)
+        self.coop_m2 = np.zeros(0)
+        self.social_mean = np.zeros(0)
+        self.social_m2 = np.zeros(0)
+
+    def grow(self, num_bins):
+        """extends the accumulated arrays if a society has agents in bins that were not seen before"""
+        extra = num_bins - len(self.samples)
+        if extra <= 0:
+            return
+        self.samples = np.append(self.samples, np.zeros(extra, dtype=np.int64))
+        self.agents = np.append(self.agents, np.zeros(extra, dtype=np.int64))
+        self.coop_mean = np.append(self.coop_mean, np.zeros(extra))
+        self.coop_m2 = np.append(self.coop_m2, np.zeros(extra))
+        self.social_mean = np.append(self.social_mean, np.zeros(extra))
+        self.social_m2 = np.append(self.social_m2, np.zeros(extra))
+
+    def update(self, society):
+        """adds the cooperation rate and social value of each bin of the society as one sample"""
+        counts, coop, social = society.degree_class_statistics(self.bin_edges)
+        self.grow(len(counts))
+
+        # only bins containing agents in this society are updated
+        present = np.flatnonzero(counts)
+        self.samples[present] += 1
+        self.agents[present] += counts[present]
+        n = self.samples[present]
+
+        # Welford's algorithm applied to all bins at once
+        delta = coop[present] - self.coop_mean[present]
+        self.coop_mean[present] += delta / n
+        self.coop_m2[present] += delta * (coop[present] - self.coop_mean[present])
+
+        delta = social[present] - self.social_mean[present]
+        self.social_mean[present] += delta / n
+        self.social_m2[present] += delta * (social[present] - self.social_mean[present])
+
+    def labels(self):
+        """returns a readable label for each bin"""
+        if self.bin_edges is None:
+            return [str(i) for i in range(len(self.samples))]
+        labels = []
+        for i in range(len(self.samples)):
+            lower = self.bin_edges[i]
+            if i + 1 == len(self.bin_edges):
+                labels.append(f'{lower}+')
+            elif self.bin_edges[i + 1] - 1 == lower:
+                labels.append(str(lower))
+            else:
+                labels.append(f'{lower}-{self.bin_edges[i + 1] - 1}')
+        return labels
+
+    def average_agents(self):
+        """average number of agents in each bin over the iterations in which the bin contained agents"""
+        return self.agents / np.maximum(self.samples, 1)
+
+    def coop_std(self):
+        """standard deviation of the cooperation rate of each bin over all iterations"""
+        return np.sqrt(self.coop_m2 / np.maximum(self.samples, 1))
+
+    def social_std(self):
+        """standard deviation of the social value of each bin over all iterations"""
+        return np.sqrt(self.social_m2 / np.maximum(self.samples, 1))
@@ -0,0 +1,62 @@
+from functools import lru_cache
+import numpy as np
+
+
+class ExplorationSchedule:
+    """ExplorationSchedule class calculating the exploration rate of an agent from the number of times it has played.
+    Possible schedules are exponential (the rate is multiplied by the decay every play), linear (the rate is reduced
+    by a fixed amount every play) and step (the rate is multiplied by the decay after a fixed number of plays)"""
+
+    def __init__(self, schedule="exponential", initial_rate=1.0, decay=0.99, linear_step=0.001, step_size=100,
+                 curve_length=10000):
+        if schedule not in ['exponential', 'linear', 'step']:
+            raise ValueError(f'Unknown exploration schedule: {schedule}')
+        if step_size <= 0:
+            raise ValueError(f'Exploration step size must be positive: {step_size}')
+        self.schedule = schedule
+        self.initial_rate = initial_rate
+        self.decay = decay
+        self.linear_step = linear_step
+        self.step_size = step_size
+
+        # the rates for the first plays are calculated once and looked up afterwards, the list is used for single
+        # agents so they get plain floats without array indexing
+        self.curve = self.array_rates(np.arange(curve_length))
+        self.curve_values = self.curve.tolist()
+
+    def rate(self, plays):
+        """exploration rate after the given number of plays for a single agent"""
+        if plays < len(self.curve_values):
+            return self.curve_values[plays]
+        return float(self.array_rates(plays))
+
+    def array_rates(self, plays):
+        """exploration rates for an array of play counts calculated in closed form"""
+        if self.schedule == 'exponential':
+            return self.initial_rate * self.decay ** plays
+        if self.schedule == 'linear':
+            # the rate can not drop below 0
+            return np.maximum(self.initial_rate - self.linear_step * plays, 0.0)
+        return self.initial_rate * self.decay ** (plays // self.step_size)
+
+    def rates(self, plays):
+        """exploration rates for an array of play counts, using the precomputed curve where possible"""
+        in_curve = plays < len(self.curve)
+        rates = self.curve[np.where(in_curve, plays, 0)]
+        if not in_curve.all():
+            rates[~in_curve] = self.array_rates(plays[~in_curve])
+        return rates
+
+
+@lru_cache(maxsize=16)
+def cached_schedule(schedule, initial_rate, decay, linear_step, step_size):
+    """creates the exploration schedule for the given parameters, or returns the one created earlier for them"""
+    return ExplorationSchedule(schedule, initial_rate, decay, linear_step, step_size)
+
+
+def exploration_schedule(sim_data):
+    """returns the exploration schedule described by the simulation data, schedules are only created once for each
+    configuration and shared by all agents and societies using it"""
+    return cached_schedule(sim_data.get("exploration_schedule", "exponential"), sim_data["exploration_rate"],
+                           sim_data["exploration_decay"], sim_data.get("exploration_linear_step", 0.001),
+                           sim_data.get("exploration_step_size", 100))
@@ -1,9 +1,9 @@
 import numpy as np
 from Society import Society
-from VisualisationScreen import VisualisationScreen
-import matplotlib.pyplot as plt
+from DegreeStatistics import DegreeStatistics, power_of_two_bins
 import os
 import argparse
+import multiprocessing
 
 # some global parameters for experimentation
 SCREEN_WIDTH = 1000
@@ -41,11 +41,22 @@ simulation_data = {
     "grid_setup": False,
     "scale_free_setup": False,
     "scale_free_links": 1,
+    # random networks are directed unless undirected_random is set, the seed makes the random network reproducible
+    "undirected_random": False,
+    "network_seed": None,
 
     # exploration setup options
     "exploration_update": False,
     "exploration_rate": 1.0,
     "exploration_decay": 0.99,
+    # schedule of the exploration rate: exponential, linear (linear_step less per play) or step (decay every step_size
+    # plays)
+    "exploration_schedule": "exponential",
+    "exploration_linear_step": 0.001,
+    "exploration_step_size": 100,
+
+    # visualisation options, headless societies skip the work only needed for drawing
+    "headless": False,
 }
 
 confidence_intervals = {
@@ -57,12 +68,16 @@ confidence_intervals = {
 
 
 def main_experiment(games_per_iter, num_iter, exploration_update=False, social_update=False, play_successive=True,
-                    experiment_name="default", experiment_dir="", social_values=None):
-    """Main experiment for iterative prisoner's dilemma"""
+                    experiment_name="default", experiment_dir="", social_values=None, graph_queue=None):
+    """Main experiment for iterative prisoner's dilemma. Returns a dictionary with the results for each social value:
+    average cooperation rate, average social value, their confidence values and the DegreeStatistics of the agent
+    groups"""
 
     # simulation data is updated to use the update values specified in the function
     simulation_data["exploration_update"] = exploration_update
     simulation_data["update_social_values"] = social_update
+    # societies in this experiment are never drawn
+    simulation_data["headless"] = True
 
     # the user can specify a list of social value orientations to be iterated which are used here
     if social_values is None:
@@ -81,6 +96,9 @@ def main_experiment(games_per_iter, num_iter, exploration_update=False, social_u
         average_social = 0
         coop_rates = []
         updated_soc = []
+        # agents of scale free networks are grouped into node classes, otherwise every number of neighbours is used
+        bin_edges = power_of_two_bins(simulation_data["num_agents"]) if simulation_data["scale_free_setup"] else None
+        degree_stats = DegreeStatistics(bin_edges)
         print('Social value currently operating:' + str(soc))
         # we are now iterating over all the specified iterations and create a new society for each
         for i in range(num_iter):
@@ -96,26 +114,15 @@ def main_experiment(games_per_iter, num_iter, exploration_update=False, social_u
 
             # calculations are performed to calculate the average cooperation rate, standard deviation, social values,
             # std deviation of updated social values and values required for producing the plots
-            defect_established = 0
-            coop_established = 0
-
-            # here we iterate over the Q values of all agents in the society and count if they cooperate or defect
-            for value in s.get_q_values():
-                if value['C'] > value['D']:
-                    coop_established += 1
-                else:
-                    defect_established += 1
-
-            # in this next step the social value orientations of the society are retrieved and averaged
-            social_values = s.get_social_values()
+            # cooperation rate is the fraction of agents whose Q values favour cooperating
+            coop = s.cooperation_rate()
+
             # this variable is the average social value orientation within this iteration, there is another average
             # averaging over all iterations
-            average_social_iter = 0.0
-            for value in social_values:
-                average_social_iter += value / len(social_values)
+            average_social_iter = s.social_value_mean()
 
-            # cooperation rate is calculated
-            coop = coop_established / (coop_established + defect_established)
+            # cooperation rate and social value are also recorded for each group of agents with similar neighbours
+            degree_stats.update(s)
 
             coop_rates.append(coop)
             updated_soc.append(average_social_iter)
@@ -133,7 +140,18 @@ def main_experiment(games_per_iter, num_iter, exploration_update=False, social_u
         std_dev_soc = np.std(updated_soc)
         confidence_value_coop = confidence_intervals[99] * (std_dev_coop / (num_iter * 1.0) ** 0.5)
         confidence_value_soc = confidence_intervals[99] * (std_dev_soc / (num_iter * 1.0) ** 0.5)
-        social_dict[soc] = (average_coop, average_social, confidence_value_coop, confidence_value_soc)
+        # the statistics for each group of agents are kept with the results, so sweeps can use them afterwards
+        social_dict[soc] = (average_coop, average_social, confidence_value_coop, confidence_value_soc, degree_stats)
+
+        # results for each group of agents are printed, so the behaviour of hubs can be compared to other agents
+        coop_std = degree_stats.coop_std()
+        social_std = degree_stats.social_std()
+        average_agents = degree_stats.average_agents()
+        for i, label in enumerate(degree_stats.labels()):
+            if degree_stats.samples[i] > 0:
+                print(f'    neighbours: {label} agents per iteration: {average_agents[i]:.1f} '
+                      f'cooperation rate: {degree_stats.coop_mean[i]:.4f} (std {coop_std[i]:.4f}) '
+                      f'social value: {degree_stats.social_mean[i]:.4f} (std {social_std[i]:.4f})')
 
     # after all experiments are run, the data is prepared to be plotted
     indices = []
@@ -163,98 +181,155 @@ def main_experiment(games_per_iter, num_iter, exploration_update=False, social_u
             os.mkdir(experiment_dir)
         experiment_name = experiment_dir + "\\" + experiment_name
 
-    # graphs are created
-    create_graphs(coop_rate, social_values, indices, confidence_values_coop, confidence_values_soc, experiment_name)
+    # graphs are created, in the background if a graph queue is given
+    record = (coop_rate, social_values, indices, confidence_values_coop, confidence_values_soc, experiment_name)
+    if graph_queue is not None:
+        graph_queue.put(record)
+    else:
+        create_graphs(*record)
+
+    return social_dict
 
 
 def create_graphs(data, data2, indices, confidence_values, confidence_values_2, name):
     """Creates two graphs, one for the cooperation rate and one for the updated social value orientation"""
+    # plotting is only imported when graphs are created, so headless runs start without loading it. Figures are
+    # drawn with the non interactive Agg canvas, so no global pyplot state or display is used
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
 
     # the defect rates are just those who do not cooperate and this is quickly calculated here
     defect_rates = [1 - x for x in data]
 
-
     width = 0.08
 
     # create plot for cooperation rates
-    fig, ax = plt.subplots()
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
     ax.grid(axis='y')
     ax.set_axisbelow(True)
-    p1 = plt.bar(indices, data, width, yerr=confidence_values)
-    p2 = plt.bar(indices, defect_rates, width, bottom=data)
+    p1 = ax.bar(indices, data, width, yerr=confidence_values)
+    p2 = ax.bar(indices, defect_rates, width, bottom=data)
 
-    plt.ylabel('cooperation percentage')
-    plt.xlabel('initial social value')
-    plt.title('cooperation rates')
-    plt.yticks(np.arange(0, 1.1, 0.1))
-    plt.xticks(np.arange(0, 1.1, 0.1))
-    plt.legend((p1[0], p2[0]), ('Coop', 'Defect'), loc="lower right")
+    ax.set_ylabel('cooperation percentage')
+    ax.set_xlabel('initial social value')
+    ax.set_title('cooperation rates')
+    ax.set_yticks(np.arange(0, 1.1, 0.1))
+    ax.set_xticks(np.arange(0, 1.1, 0.1))
+    ax.legend((p1[0], p2[0]), ('Coop', 'Defect'), loc="lower right")
 
-    # store and clear the plot
-    plt.savefig(name + '.png', dpi=300)
-    plt.clf()
+    # store the plot
+    fig.savefig(name + '.png', dpi=300)
 
     # create plot for updated social values
-    fig, ax = plt.subplots()
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
     ax.grid(axis='y')
     ax.set_axisbelow(True)
-    plt.bar(indices, data2, width, yerr=confidence_values_2)
+    ax.bar(indices, data2, width, yerr=confidence_values_2)
+
+    ax.set_ylabel('updated social value')
+    ax.set_xlabel('initial social value')
+    ax.set_title('updated social values')
+    ax.set_yticks(np.arange(0, 1.1, 0.1))
+    ax.set_xticks(np.arange(0, 1.1, 0.1))
+
+    # store the plot
+    fig.savefig(name + '_social_values.png', dpi=300)
 
-    plt.ylabel('updated social value')
-    plt.xlabel('initial social value')
-    plt.title('updated social values')
-    plt.yticks(np.arange(0, 1.1, 0.1))
-    plt.xticks(np.arange(0, 1.1, 0.1))
 
-    # store and clear the plot
-    plt.savefig(name + '_social_values.png', dpi=300)
-    plt.clf()
+def graph_worker(graph_queue):
+    """Renders the graphs of finished experiments received through the queue until None is received"""
+    while True:
+        record = graph_queue.get()
+        if record is None:
+            break
+        try:
+            create_graphs(*record)
+        except Exception as e:
+            # a failing graph should not stop the graphs of the other experiments from being created
+            print(f'Error creating graphs for {record[-1]}: {e}')
+
+
+def start_graph_worker():
+    """Starts a background process rendering graphs, experiments put their results into the returned queue so they
+    can continue while the graphs are created. The queue is provided by a manager process, so it can also be passed
+    as an argument to pool workers running several experiments at the same time"""
+    manager = multiprocessing.Manager()
+    graph_queue = manager.Queue()
+    worker = multiprocessing.Process(target=graph_worker, args=(graph_queue,))
+    worker.start()
+    return graph_queue, worker, manager
+
+
+def stop_graph_worker(graph_queue, worker, manager):
+    """Waits for the background process to render all remaining graphs and stops it and the queue manager"""
+    graph_queue.put(None)
+    worker.join()
+    manager.shutdown()
 
 
 def visual_experiment():
     """Default visual experiment, only run with either grid or scale free setup as
     it does not provide useful insight to random networks"""
+    # the window library is only imported when a visual experiment is run, as it requires a display
+    from VisualisationScreen import VisualisationScreen
 
     if simulation_data['grid_setup'] is False and simulation_data['scale_free_setup'] is False:
         simulation_data['grid_setup'] = True
+    simulation_data['headless'] = False
 
     # society and visualisation screen are created, the visualisation screen then takes over the experiment
     s = Society(simulation_data)
     VisualisationScreen(s, width=SCREEN_WIDTH, height=SCREEN_HEIGHT, title="Visualisation", tick=0.1)
 
 
-def experiment_set(games_per_iter=50000, num_iter=1000, results=""):
+def experiment_set(games_per_iter=50000, num_iter=1000, results="", graph_queue=None):
     """Full run of experiments described in project"""
     main_experiment(games_per_iter=games_per_iter, num_iter=num_iter, exploration_update=True, social_update=True,
-                    experiment_name="default", experiment_dir=results)
+                    experiment_name="default", experiment_dir=results,
+                    graph_queue=graph_queue)
     main_experiment(games_per_iter=games_per_iter, num_iter=num_iter, exploration_update=False, social_update=True,
-                    experiment_name="default", experiment_dir=results)
+                    experiment_name="default", experiment_dir=results,
+                    graph_queue=graph_queue)
     main_experiment(games_per_iter=games_per_iter, num_iter=num_iter, exploration_update=True, social_update=False,
-                    experiment_name="default", experiment_dir=results)
+                    experiment_name="default", experiment_dir=results,
+                    graph_queue=graph_queue)
     main_experiment(games_per_iter=games_per_iter, num_iter=num_iter, exploration_update=False, social_update=False,
-                    experiment_name="default", experiment_dir=results)
+                    experiment_name="default", experiment_dir=results,
+                    graph_queue=graph_queue)
 
     simulation_data["grid_setup"] = True
     main_experiment(games_per_iter=games_per_iter, num_iter=num_iter, exploration_update=True, social_update=True,
-                    experiment_name="grid", experiment_dir=results)
+                    experiment_name="grid", experiment_dir=results,
+                    graph_queue=graph_queue)
     main_experiment(games_per_iter=games_per_iter, num_iter=num_iter, exploration_update=False, social_update=True,
-                    experiment_name="grid", experiment_dir=results)
+                    experiment_name="grid", experiment_dir=results,
+                    graph_queue=graph_queue)
     main_experiment(games_per_iter=games_per_iter, num_iter=num_iter, exploration_update=True, social_update=False,
-                    experiment_name="grid", experiment_dir=results)
+                    experiment_name="grid", experiment_dir=results,
+                    graph_queue=graph_queue)
     main_experiment(games_per_iter=games_per_iter, num_iter=num_iter, exploration_update=False, social_update=False,
-                    experiment_name="grid", experiment_dir=results)
+                    experiment_name="grid", experiment_dir=results,
+                    graph_queue=graph_queue)
     #
     simulation_data["grid_setup"] = False
     simulation_data["scale_free_setup"] = True
     simulation_data["scale_free_links"] = 1
     main_experiment(games_per_iter=games_per_iter, num_iter=num_iter, exploration_update=False, social_update=True,
-                    experiment_name="scale", experiment_dir=results)
+                    experiment_name="scale", experiment_dir=results,
+                    graph_queue=graph_queue)
     main_experiment(games_per_iter=games_per_iter, num_iter=num_iter, exploration_update=True, social_update=True,
-                    experiment_name="scale", experiment_dir=results)
+                    experiment_name="scale", experiment_dir=results,
+                    graph_queue=graph_queue)
     main_experiment(games_per_iter=games_per_iter, num_iter=num_iter, exploration_update=True, social_update=False,
-                    experiment_name="scale", experiment_dir=results)
+                    experiment_name="scale", experiment_dir=results,
+                    graph_queue=graph_queue)
     main_experiment(games_per_iter=games_per_iter, num_iter=num_iter, exploration_update=False, social_update=False,
-                    experiment_name="scale", experiment_dir=results)
+                    experiment_name="scale", experiment_dir=results,
+                    graph_queue=graph_queue)
 
 
 def parse_arguments():
@@ -284,6 +359,12 @@ def parse_arguments():
     parser.add_argument('--network', '-net', type=str,
                         help="Type of network to be used other than random (scale, grid)")
     parser.add_argument('--exploration_decay', '-ed', type=float, help="Exploration decay to be used")
+    parser.add_argument('--exploration_schedule', '-es', type=str,
+                        help="Schedule for updating the exploration rate (exponential, linear, step)")
+    parser.add_argument('--exploration_linear_step', '-els', type=float,
+                        help="Amount the exploration rate is reduced by every play for the linear schedule")
+    parser.add_argument('--exploration_step_size', '-ess', type=int,
+                        help="Number of plays between exploration decays for the step schedule")
     parser.add_argument('--grid_size', '-gs', type=int, help="Grid size to be used if a grid experiment is run")
     parser.add_argument('--scale_free_links', '-sfl', type=int, help="Number of links created per added agent")
     parser.add_argument('--initial_social_value', '-isv', type=float, help="Initial social value orientation")
@@ -327,6 +408,15 @@ def parse_arguments():
             simulation_data['scale_free_setup'] = True
     if args.exploration_decay is not None:
         simulation_data["exploration_decay"] = args.exploration_decay
+    if args.exploration_schedule is not None and args.exploration_schedule in ['exponential', 'linear', 'step']:
+        simulation_data["exploration_schedule"] = args.exploration_schedule
+    if args.exploration_linear_step is not None:
+        simulation_data["exploration_linear_step"] = args.exploration_linear_step
+    if args.exploration_step_size is not None:
+        if args.exploration_step_size > 0:
+            simulation_data["exploration_step_size"] = args.exploration_step_size
+        else:
+            print(f'Warning: exploration step size must be positive, using {simulation_data["exploration_step_size"]}')
     if args.grid_size is not None:
         simulation_data["grid_size"] = args.grid_size
     if args.initial_social_value is not None:
@@ -340,17 +430,31 @@ def parse_arguments():
     if args.social_step_size is not None:
         simulation_data["social_step_size"] = args.social_step_size
 
+    # random networks can not give agents more distinct neighbours than there are other agents
+    if simulation_data["num_neighbours"] > simulation_data["num_agents"] - 1:
+        print(f'Warning: {simulation_data["num_neighbours"]} neighbours requested for {simulation_data["num_agents"]} '
+              f'agents, using {simulation_data["num_agents"] - 1} neighbours')
+        simulation_data["num_neighbours"] = simulation_data["num_agents"] - 1
+
     return games, iterations, name, directory, experiment
 
 
 def main():
     games, iterations, name, dictionary, experiment = parse_arguments()
-    if experiment == 'single':
-        main_experiment(games_per_iter=games, num_iter=iterations, experiment_name=name, experiment_dir=dictionary)
-    elif experiment == 'visual':
+    if experiment == 'visual':
         visual_experiment()
-    elif experiment == 'full':
-        experiment_set(games, iterations, dictionary)
+        return
+
+    # graphs are rendered in a background process while the experiments continue
+    graph_queue, worker, manager = start_graph_worker()
+    try:
+        if experiment == 'single':
+            main_experiment(games_per_iter=games, num_iter=iterations, experiment_name=name,
+                            experiment_dir=dictionary, graph_queue=graph_queue)
+        elif experiment == 'full':
+            experiment_set(games, iterations, dictionary, graph_queue)
+    finally:
+        stop_graph_worker(graph_queue, worker, manager)
 
 
 if __name__ == '__main__':
@@ -2,34 +2,129 @@ import random
 import math
 import numpy as np
 from Agent import Agent
-
-
-def scale_free_neighbour_location_setup(agent, radius, base_orientation):
-    theta_range = np.arange(base_orientation, base_orientation+ 2 * math.pi, 2 * math.pi / len(agent.neighbours))
-    # initially, we position the agent
-    unpositioned_neighbours = [x for x in agent.neighbours if x.location[0] is 0 and x.location[1] is 0]
-    if len(unpositioned_neighbours) is 0:
-        return
-
-    thetas = np.zeros(len(unpositioned_neighbours))
-    calculation_radii = np.zeros(len(unpositioned_neighbours))
-    for i in range(len(unpositioned_neighbours)):
-        # theta is the interpolation between 0 and 2*pi
-        thetas[i] = theta_range[i]
-        calculation_radius = radius * len(unpositioned_neighbours[i].neighbours)/len(agent.neighbours)
-        calculation_radii[i] = calculation_radius
-        x = agent.location[0] + calculation_radius * math.sin(thetas[i])
-        y = agent.location[1] + calculation_radius * math.cos(thetas[i])
-        neighbour: Agent = unpositioned_neighbours[i]
-        neighbour.location = (x, y)
-
-    for i in range(len(unpositioned_neighbours)):
-        scale_free_neighbour_location_setup(unpositioned_neighbours[i], calculation_radii[i]*0.8, thetas[i])
-
+from ExplorationSchedule import exploration_schedule
+
+
+def scale_free_layout(agents, radius, centre):
+    """computes a radial layout for a scale free network, starting from the first agent in the list. The network is
+    traversed breadth first, one level at a time, so deep networks do not run into the recursion limit. Every agent
+    is placed around the agent it was reached from, at a distance relative to the ratio of their degrees.
+    Returns the x and y positions of all agents as arrays in the order of the agent list.
+    On trees (scale_free_links of 1) this is the same layout as placing the agents depth first. If the network has
+    cycles (scale_free_links above 1), an agent is placed by the first agent of the closest level that reaches it,
+    while a depth first traversal would place it from the first branch that reaches it, so such layouts differ"""
+    num_agents = len(agents)
+
+    # the network is converted into compressed adjacency arrays so a whole level can be processed at once
+    index = {id(agent): i for i, agent in enumerate(agents)}
+    degrees = np.fromiter((len(agent.neighbours) for agent in agents), dtype=np.int64, count=num_agents)
+    adjacency = np.fromiter((index[id(n)] for agent in agents for n in agent.neighbours), dtype=np.int64,
+                            count=int(degrees.sum()))
+    adjacency_start = np.concatenate(([0], np.cumsum(degrees)[:-1]))
+
+    xs = np.full(num_agents, centre[0], dtype=float)
+    ys = np.full(num_agents, centre[1], dtype=float)
+    # radius and orientation used for placing the neighbours of each agent
+    radii = np.zeros(num_agents)
+    thetas = np.zeros(num_agents)
+    placed = np.zeros(num_agents, dtype=bool)
+
+    radii[0] = radius
+    placed[0] = True
+    frontier = np.array([0])
+
+    while len(frontier) > 0:
+        frontier = frontier[degrees[frontier] > 0]
+        # all links leaving the current level, with the agent they are leaving from
+        parents = np.repeat(frontier, degrees[frontier])
+        offsets = np.arange(len(parents)) - np.repeat(np.cumsum(degrees[frontier]) - degrees[frontier],
+                                                      degrees[frontier])
+        children = adjacency[adjacency_start[parents] + offsets]
+
+        # only unplaced agents are positioned, each by the first agent of the level that reaches it
+        unplaced = ~placed[children]
+        parents = parents[unplaced]
+        children = children[unplaced]
+        first = np.sort(np.unique(children, return_index=True)[1])
+        parents = parents[first]
+        children = children[first]
+        if len(children) == 0:
+            break
+
+        # the position of a child among the unplaced neighbours of its parent determines its angle
+        new_group = np.concatenate(([True], parents[1:] != parents[:-1]))
+        group_start = np.flatnonzero(new_group)
+        rank = np.arange(len(children)) - np.repeat(group_start, np.diff(np.append(group_start, len(children))))
+
+        child_thetas = thetas[parents] + rank * 2 * math.pi / degrees[parents]
+        child_radii = radii[parents] * degrees[children] / degrees[parents]
+        xs[children] = xs[parents] + child_radii * np.sin(child_thetas)
+        ys[children] = ys[parents] + child_radii * np.cos(child_thetas)
+
+        # the neighbours of the children are placed closer to them
+        radii[children] = child_radii * 0.8
+        thetas[children] = child_thetas
+        placed[children] = True
+        frontier = children
+
+    return xs, ys
+
+
+def random_k_out_network(num_agents, k, rng):
+    """creates a directed random network in which every agent picks k distinct other agents as neighbours.
+    Returns an array with one row of neighbour indices per agent"""
+    if k > num_agents - 1:
+        raise ValueError(f'cannot pick {k} distinct neighbours from {num_agents - 1} other agents')
+
+    if 16 * k <= num_agents - 1:
+        # neighbours are drawn with replacement and repeated neighbours are redrawn until every row is distinct.
+        # Only a small share of the other agents is picked, so few redrawn neighbours repeat again
+        neighbours = rng.integers(0, num_agents - 1, size=(num_agents, k))
+        rows = np.arange(num_agents)
+        while len(rows) > 0:
+            candidates = neighbours[rows]
+            order = np.argsort(candidates, axis=1, kind='stable')
+            ordered = np.take_along_axis(candidates, order, axis=1)
+            # every occurrence of a neighbour after the first one is marked as repeated
+            repeated = np.zeros(candidates.shape, dtype=bool)
+            np.put_along_axis(repeated, order[:, 1:], ordered[:, 1:] == ordered[:, :-1], axis=1)
+            has_repeated = repeated.any(axis=1)
+            rows = rows[has_repeated]
+            row_index, column = np.nonzero(repeated[has_repeated])
+            neighbours[rows[row_index], column] = rng.integers(0, num_agents - 1, size=len(column))
+    else:
+        # for dense networks the k agents with the smallest random keys are picked, the keys are created for a
+        # block of agents at a time to limit the memory used
+        neighbours = np.empty((num_agents, k), dtype=np.int64)
+        block = max(1, 2 ** 22 // num_agents)
+        for start in range(0, num_agents, block):
+            keys = rng.random((min(block, num_agents - start), num_agents - 1))
+            neighbours[start:start + block] = keys.argpartition(k - 1, axis=1)[:, :k]
+
+    # indices are drawn from all other agents, so indices from the agent itself onwards are shifted by one
+    return neighbours + (neighbours >= np.arange(num_agents)[:, None])
+
+
+def random_undirected_network(num_agents, k, rng):
+    """creates an undirected Erdos-Renyi network with num_agents * k / 2 distinct links, so agents have k neighbours
+    on average. Returns two arrays holding the agents at both ends of each link"""
+    num_pairs = num_agents * (num_agents - 1) // 2
+    num_links = min(num_agents * k // 2, num_pairs)
+
+    # every pair of agents is identified by a number, which are drawn without replacement
+    pairs = rng.choice(num_pairs, size=num_links, replace=False)
+
+    # the numbers are converted back to the pair (i, j) with j < i where pair = i * (i - 1) / 2 + j
+    first = ((1 + np.sqrt(1 + 8 * pairs.astype(float))) // 2).astype(np.int64)
+    first -= first * (first - 1) // 2 > pairs
+    first += (first + 1) * first // 2 <= pairs
+    second = pairs - first * (first - 1) // 2
+    return first, second
 
 
 class Society:
-    """Society class hosting number of agents with set number of neighbours"""
+    """Society class hosting number of agents with set number of neighbours. Headless societies skip the layout of
+    their agents, which is only calculated once ensure_layout is called"""
 
     def __init__(self, sim_data):
         self.sim_data = sim_data
@@ -37,47 +132,98 @@ class Society:
         self.lr = sim_data["learning_rate"]
         self.num_agents = sim_data["num_agents"]
         self.update_social_values = sim_data["update_social_values"]
+        # headless societies are never drawn, so work that is only needed for visualisation is skipped
+        self.headless = sim_data.get("headless", False)
+        # random networks are created with their own generator, so they can be reproduced by setting a seed
+        self.rng = np.random.default_rng(sim_data.get("network_seed"))
+        # batched action selection uses a separate unseeded generator, so a network seed does not repeat the
+        # exploration decisions of every society
+        self.action_rng = np.random.default_rng()
+        self.exploration_schedule = exploration_schedule(sim_data)
 
         # actions for prisoners dilemma
         self.actions = sim_data["actions"]
         self.social_value = sim_data["initial_social_value"]
-        self.grid_size = int(math.ceil((1.0 * self.num_agents) ** 0.5))
         self.grid_step = 20
-        size = self.grid_size * self.grid_step
         self.width = sim_data["width"]
         self.height = sim_data["height"]
-        self.offset_x = self.width / 2 - size / 2
-        self.offset_y = self.height / 2 - size / 2
+
+        # layout and network diagnostics are only calculated once they are needed
+        self.located = False
+        self._grid_size = None
+        self._offset_x = None
+        self._offset_y = None
+        self._degrees = None
+        self._degree_histogram = None
+        # arrays describing the state of the agents, read once after the society has played
+        self._state_arrays = None
 
         if sim_data['grid_setup']:
             self.setup_agents_grid(sim_data["grid_size"])
         elif sim_data['scale_free_setup']:
             self.setup_neighbours_ba()
-            agent_neighbour_buckets = {}
-            for agent in self.agents:
-                neighbours = len(agent.neighbours)
-                if neighbours in agent_neighbour_buckets:
-                    agent_neighbour_buckets[neighbours] += 1
-                else:
-                    agent_neighbour_buckets[neighbours] = 1
-            for i in range(max(agent_neighbour_buckets.keys()) + 1):
-                pass
-                # num_agents = (agent_neighbour_buckets[i] if i in agent_neighbour_buckets else 0)
-                # print("neighbours: " + str(i) + " agents: " + str(num_agents))
+        elif sim_data.get("undirected_random", False):
+            self.setup_neighbours_random_undirected(sim_data["num_neighbours"])
         else:
             self.setup_neighbours_random(sim_data["num_neighbours"])
 
-    def setup_agents_grid(self, square):
-        self.grid_step = 20
+        if not self.headless:
+            self.ensure_layout()
+
+    @property
+    def grid_size(self):
+        """side length of the square used to place the agents of a random network"""
+        if self._grid_size is None:
+            self._grid_size = int(math.ceil((1.0 * self.num_agents) ** 0.5))
+        return self._grid_size
+
+    @property
+    def offset_x(self):
+        self.ensure_layout()
+        return self._offset_x
+
+    @property
+    def offset_y(self):
+        self.ensure_layout()
+        return self._offset_y
+
+    @property
+    def degree_histogram(self):
+        """number of agents for each number of neighbours, the index of the array is the number of neighbours"""
+        if self._degree_histogram is None:
+            self._degree_histogram = np.bincount(self.get_degrees())
+        return self._degree_histogram
+
+    def create_agent(self):
+        """creates an agent for this society, agents have no location until ensure_layout places them"""
+        return Agent(self.sim_data, location=None, schedule=self.exploration_schedule)
+
+    def ensure_layout(self):
+        """places the agents on the screen if this has not been done yet. Societies that are not headless do this
+        during construction. In headless societies the location of every agent is None until this is called, so code
+        reading agent.location of a headless society has to call this first"""
+        if self.located:
+            return
+        self.located = True
+
+        square = self.sim_data["grid_size"] if self.sim_data['grid_setup'] else self.grid_size
         size = square * self.grid_step
-        self.offset_x = self.width / 2 - size / 2
-        self.offset_y = self.height / 2 - size / 2
+        self._offset_x = self.width / 2 - size / 2
+        self._offset_y = self.height / 2 - size / 2
 
-        self.agents = []
-        for y in range(square):
-            for x in range(square):
-                self.agents.append(
-                    Agent(self.sim_data, (self.grid_step * x + self.offset_x, self.grid_step * y + self.offset_y)))
+        if self.sim_data['scale_free_setup'] and not self.sim_data['grid_setup']:
+            self.setup_scale_free_locations()
+        else:
+            self.setup_square_locations(square)
+
+    def setup_square_locations(self, square):
+        """places the agents row by row on a square with the given side length"""
+        for i, agent in enumerate(self.agents):
+            agent.location = ((i % square) * self.grid_step + self._offset_x,
+                              (i // square) * self.grid_step + self._offset_y)
+
+    def setup_agents_grid(self, square):
+        self.agents = [self.create_agent() for _ in range(square * square)]
 
         for y in range(square):
             for x in range(square):
@@ -102,7 +248,7 @@ class Society:
 
         # initiate first agent
         for i in range(self.num_agents):
-            agent = Agent(self.sim_data)
+            agent = self.create_agent()
 
             # add neighbours from already existing agents:
             if len(self.agents) > 0:
@@ -139,57 +285,58 @@ class Society:
         # after connecting the agents we need to place them onto the grid in a nice way to visualise the scale free network
         # sort agents by number of neighbours they have
         self.agents.sort(key=lambda x: len(x.neighbours), reverse=True)
-        # take first agent and set it to be the centre:
-        core: Agent = self.agents[0]
-        core.location = (self.sim_data['width'] / 2, self.sim_data['height'] / 2)
 
-        scale_free_neighbour_location_setup(core, self.sim_data['width']/2, 0)
+    def setup_scale_free_locations(self):
+        """places the agents of a scale free network radially around the agent with the most neighbours and centres
+        the network on the screen"""
+        centre = (self.sim_data['width'] / 2, self.sim_data['height'] / 2)
+        xs, ys = scale_free_layout(self.agents, self.sim_data['width'] / 2, centre)
 
         # average overall position of all agents to centre of screen
-        average_pos = (0,0)
-        for agent in self.agents:
-            average_pos = np.add(average_pos, agent.location)
-        average_pos = np.divide(average_pos, len(self.agents))
-        centre = (self.sim_data['width']/2, self.sim_data['height']/2)
-        offset = np.subtract(centre,average_pos)
-        # adjust all agents' positions
-        for agent in self.agents:
-            agent.location = np.add(agent.location, offset)
+        xs += centre[0] - xs.mean()
+        ys += centre[1] - ys.mean()
+        for agent, x, y in zip(self.agents, xs.tolist(), ys.tolist()):
+            agent.location = (x, y)
 
     def setup_neighbours_random(self, num_neighbours):
-        self.agents = []
-        for i in range(self.num_agents):
-            x_loc = (i % self.grid_size) * self.grid_step + self.offset_x
-            y_loc = math.floor(1.0 * i / self.grid_size) * self.grid_step + self.offset_y
-            self.agents.append(
-                Agent(self.sim_data, (x_loc, y_loc)))
-
-        for agent in self.agents:
-            # create new neighbours for agent, need to ensure that the neighbours are not added twice
-            agents_without_current = [x for x in self.agents if x is not agent]
-
-            random_agents = random.choices(agents_without_current, k=num_neighbours)
-            agent.set_neighbours(random_agents)
-
-    def setup_neighbours_random_no_double(self, k):
-        self.agents = []
-        for i in range(self.num_agents):
-            x_loc = (i % self.grid_size) * self.grid_step + self.offset_x
-            y_loc = math.floor(1.0 * i / self.grid_size) * self.grid_step + self.offset_y
-            self.agents.append(Agent(self.actions, location=(x_loc, y_loc)))
-
-        for agent in self.agents:
-            # create new neighbours for agent, need to ensure that the neighbours are not added twice
-            agents_without_current = [x for x in self.agents if x not in agent.neighbours]
-            agents_without_current.remove(agent)
-
-            random_agents = random.choices(agents_without_current, k=k - len(agent.neighbours))
-            agent.set_neighbours(random_agents)
-            for neighbour in random_agents:
-                neighbour.add_neighbour(agent)
+        """sets up a directed random network in which every agent has num_neighbours distinct neighbours"""
+        self.agents = [self.create_agent() for _ in range(self.num_agents)]
+
+        # agents can not have more distinct neighbours than there are other agents
+        if num_neighbours > self.num_agents - 1:
+            print(f'Warning: {num_neighbours} neighbours requested for {self.num_agents} agents, '
+                  f'using {self.num_agents - 1} neighbours')
+            num_neighbours = self.num_agents - 1
+
+        neighbours = random_k_out_network(self.num_agents, num_neighbours, self.rng)
+        for agent, row in zip(self.agents, neighbours.tolist()):
+            agent.set_neighbours([self.agents[i] for i in row])
+
+    def setup_neighbours_random_undirected(self, num_neighbours):
+        """sets up an undirected random network in which agents have num_neighbours neighbours on average"""
+        self.agents = [self.create_agent() for _ in range(self.num_agents)]
+
+        first, second = random_undirected_network(self.num_agents, num_neighbours, self.rng)
+        # every link is stored in both directions and grouped by the agent it starts from
+        sources = np.concatenate((first, second))
+        targets = np.concatenate((second, first))
+        order = np.argsort(sources, kind='stable')
+        starts = np.searchsorted(sources[order], np.arange(self.num_agents + 1))
+        targets = targets[order].tolist()
+        for i, agent in enumerate(self.agents):
+            agent.set_neighbours([self.agents[j] for j in targets[starts[i]:starts[i + 1]]])
+
+        # agents without any links are connected to a random agent so every agent has someone to play with. Agents
+        # are checked again, as an earlier isolated agent may already have been connected to them
+        for i in np.flatnonzero(np.diff(starts) == 0).tolist():
+            if len(self.agents[i].neighbours) > 0:
+                continue
+            other = (i + 1 + int(self.rng.integers(self.num_agents - 1))) % self.num_agents
+            self.set_neighbours(self.agents[i], self.agents[other])
 
     def setup_neighbours_nearest(self, k):
         """sets up the network in a way that every agent is connected to the k nearest other agents"""
+        self.ensure_layout()
         for agent in self.agents:
             agents_without_current = list(self.agents)
             agents_without_current.remove(agent)
@@ -215,9 +362,88 @@ class Society:
     def get_social_values(self):
         return [x.social_value for x in self.agents]
 
+    def get_q_matrix(self):
+        """returns the q values of all agents as an array with one row per agent and one column per action"""
+        num_actions = len(self.actions)
+        q_values = np.fromiter((x.Q_values[a] for x in self.agents for a in self.actions), dtype=float,
+                               count=len(self.agents) * num_actions)
+        return q_values.reshape(len(self.agents), num_actions)
+
+    def get_social_value_array(self):
+        """returns the social values of all agents as an array"""
+        return np.fromiter((x.social_value for x in self.agents), dtype=float, count=len(self.agents))
+
+    def get_action_array(self):
+        """returns the index of the last selected action of all agents as an array"""
+        action_index = {a: i for i, a in enumerate(self.actions)}
+        return np.fromiter((action_index[x.selected_choice] for x in self.agents), dtype=np.int64,
+                           count=len(self.agents))
+
+    def get_degrees(self):
+        """returns the number of neighbours of all agents as an array, the network does not change after setup so
+        this is only calculated once"""
+        if self._degrees is None:
+            self._degrees = np.fromiter((len(x.neighbours) for x in self.agents), dtype=np.int64,
+                                        count=len(self.agents))
+        return self._degrees
+
+    def get_state_arrays(self):
+        """returns a boolean array marking the agents that have established cooperation, meaning their q value for
+        cooperating is higher than the one for defecting, and an array of the social values of all agents. Both are
+        read from the agents once and kept until the society plays again, so all summaries of an iteration share a
+        single pass over the agents. Changing agents directly instead of through the society is not noticed"""
+        if self._state_arrays is None:
+            q_matrix = self.get_q_matrix()
+            cooperating = q_matrix[:, self.actions.index('C')] > q_matrix[:, self.actions.index('D')]
+            self._state_arrays = (cooperating, self.get_social_value_array())
+        return self._state_arrays
+
+    def get_cooperating(self):
+        """returns a boolean array marking the agents that have established cooperation"""
+        return self.get_state_arrays()[0]
+
+    def cooperation_rate(self):
+        """fraction of agents that have established cooperation"""
+        return np.count_nonzero(self.get_cooperating()) / len(self.agents)
+
+    def social_value_mean(self):
+        """average social value of all agents"""
+        return float(self.get_state_arrays()[1].mean())
+
+    def social_value_std(self):
+        """standard deviation of the social values of all agents"""
+        return float(self.get_state_arrays()[1].std())
+
+    def cooperation_by_degree(self):
+        """fraction of agents that have established cooperation for each number of neighbours, the index of the
+        array is the number of neighbours and degrees without agents are nan"""
+        counts, cooperation, _ = self.degree_class_statistics()
+        return np.where(counts > 0, cooperation, np.nan)
+
+    def degree_class_statistics(self, bin_edges=None):
+        """groups the agents by their number of neighbours and returns the number of agents, the fraction of agents
+        that have established cooperation and the average social value of each group. Without bin edges every number
+        of neighbours is its own group, otherwise agents are grouped by the bin their number of neighbours falls into,
+        the first bin edge has to be 0. Groups without agents have a cooperation rate and social value of 0"""
+        cooperating, social_values = self.get_state_arrays()
+        counts = self.degree_histogram
+        if bin_edges is None:
+            classes = self.get_degrees()
+        else:
+            classes = np.searchsorted(bin_edges, self.get_degrees(), side='right') - 1
+            # the histogram is extended so every bin edge falls inside it before it is summed per bin
+            counts = np.append(counts, np.zeros(max(bin_edges[-1] + 1 - len(counts), 0), dtype=counts.dtype))
+            counts = np.add.reduceat(counts, bin_edges)
+        cooperation = np.bincount(classes, weights=cooperating, minlength=len(counts))
+        social = np.bincount(classes, weights=social_values, minlength=len(counts))
+        divisor = np.maximum(counts, 1)
+        return counts, cooperation / divisor, social / divisor
+
     def play_game(self):
         """function to play individual games, games are not played at the same time. Agents use the last move played
-        by their neighbours for deciding q values"""
+        by their neighbours for deciding q values. As every game depends on the q values and moves left by the
+        previous one, actions are polled one agent at a time here and not batched like in play_all"""
+        self._state_arrays = None
         agent_to_play_1 = random.choice(self.agents)
         agent_to_play_2 = random.choice(agent_to_play_1.neighbours)
         action1 = agent_to_play_1.poll_action()
@@ -245,12 +471,40 @@ class Society:
             agent_to_play_2.update_social_value()
             agent_to_play_1.update_social_value()
 
+    def poll_actions(self, agents):
+        """polls the actions of several agents at once, equivalent to calling poll_action on every agent. The
+        exploration decision is made with one random draw for all agents and the best actions are taken from the
+        q values of all agents together"""
+        if len(agents) == 0:
+            return
+        for agent in agents:
+            agent.played = True
+            agent.plays += 1
+
+        if self.sim_data["exploration_update"]:
+            plays = np.fromiter((x.plays for x in agents), dtype=np.int64, count=len(agents))
+            rates = self.exploration_schedule.rates(plays)
+        else:
+            rates = np.fromiter((x.exploration_rate for x in agents), dtype=float, count=len(agents))
+
+        # epsilon greedy action selection, the first action with the highest q value is the best action
+        q_matrix = np.array([[x.Q_values[a] for a in self.actions] for x in agents], dtype=float)
+        choices = q_matrix.argmax(axis=1)
+        explore = self.action_rng.random(len(agents)) < rates
+        choices[explore] = self.action_rng.integers(len(self.actions), size=int(explore.sum()))
+
+        for agent, rate, choice in zip(agents, rates.tolist(), choices.tolist()):
+            agent.exploration_rate = rate
+            agent.selected_choice = self.actions[choice]
+
     def play_all(self, iterations=1, verbose=False):
         """function to play a game at the same time for entire society. Agents are informed about moves of the
         neighbours that they took in the same iteration"""
+        self._state_arrays = None
         for i in range(iterations):
             if verbose and (i+1) % 1000 is 0:
                 print('iteration: '+str(i))
+            playing = []
             for agent in self.agents:
                 if not agent.played:
                     possible_opponents = [x for x in agent.neighbours if not x.played]
@@ -258,8 +512,12 @@ class Society:
                         opponent = random.choice(possible_opponents)
                         agent.set_opponent(opponent)
                         opponent.set_opponent(agent)
-                        agent.poll_action()
-                        opponent.poll_action()
+                        agent.played = True
+                        opponent.played = True
+                        playing.append(agent)
+                        playing.append(opponent)
+            # all agents that found an opponent select their actions at once
+            self.poll_actions(playing)
 
             for agent in self.agents:
                 if agent.opponent is not None:
@@ -9,6 +9,9 @@ class VisualisationScreen(arcade.Window):
         self.width = width
         self.height = height
         self.society = society
+        # headless societies place their agents only when they are drawn
+        if self.society is not None:
+            self.society.ensure_layout()
         self.connection_drawn = False
         self.tick = tick
         self.print_tick = print_tick
@@ -58,24 +61,13 @@ class VisualisationScreen(arcade.Window):
         # after a different fixed time interval cooperation values are printed to the screen
         if self.print_time_elapsed > self.print_tick:
             self.print_time_elapsed = 0
-            social_value_average = 0
-            defecting = len([x for x in self.society.agents if x.selected_choice == 'D'])
-            cooperating = len([x for x in self.society.agents if x.selected_choice == 'C'])
-            for agent in self.society.agents:
-                social_value_average += agent.social_value
+            actions = self.society.get_action_array()
+            defecting = int((actions == self.society.actions.index('D')).sum())
+            cooperating = int((actions == self.society.actions.index('C')).sum())
 
             # data is prepared and finally printed to the console
-            defect_established = 0
-            coop_established = 0
-            for value in self.society.get_q_values():
-                if value['C'] > value['D']:
-                    coop_established += 1
-                else:
-                    defect_established += 1
-            # coop established
-            coop_rate = coop_established / (coop_established + defect_established)
-
-            social_value_average /= len(self.society.agents)
+            coop_rate = self.society.cooperation_rate()
+            social_value_average = self.society.social_value_mean()
             print(f'Social value average: {social_value_average:.2f} Agents defecting: {defecting} Agents cooperating: {cooperating} Cooperation Rate: {coop_rate:.2f}')
 
     def on_mouse_press(self, x: float, y: float, button: int, modifiers: int):
@@ -0,0 +1,88 @@
+import numpy as np
+from DegreeStatistics import DegreeStatistics, power_of_two_bins
+from Society import Society
+
+
+class FixedSociety:
+    """stands in for a society returning given degree class statistics"""
+
+    def __init__(self, counts, coop, social):
+        self.result = (np.array(counts), np.array(coop, dtype=float), np.array(social, dtype=float))
+
+    def degree_class_statistics(self, bin_edges=None):
+        return self.result
+
+
+sim_data = {
+    "width": 1000,
+    "height": 1000,
+    "num_agents": 300,
+    "learning_rate": 0.01,
+    "num_neighbours": 20,
+    "update_social_values": False,
+    "random_social_value": True,
+    "std_dev": 0.1,
+    "initial_social_value": 0.5,
+    "social_adjustment": 1,
+    "social_step_size": 0.1,
+    "actions": ['C', 'D'],
+    "grid_size": 20,
+    "grid_setup": False,
+    "scale_free_setup": True,
+    "scale_free_links": 1,
+    "exploration_update": False,
+    "exploration_rate": 1.0,
+    "exploration_decay": 0.99,
+    "headless": True,
+}
+
+
+def test_streaming_mean_and_std_match_numpy():
+    rng = np.random.default_rng(0)
+    coop = rng.random((50, 3))
+    social = rng.random((50, 3))
+    # the last bin only contains agents in some iterations
+    counts = np.ones((50, 3), dtype=np.int64)
+    counts[::3, 2] = 0
+
+    stats = DegreeStatistics()
+    for i in range(50):
+        stats.update(FixedSociety(counts[i], coop[i], social[i]))
+
+    for b in range(3):
+        present = counts[:, b] > 0
+        assert stats.samples[b] == present.sum()
+        assert np.isclose(stats.coop_mean[b], coop[present, b].mean())
+        assert np.isclose(stats.coop_std()[b], coop[present, b].std())
+        assert np.isclose(stats.social_mean[b], social[present, b].mean())
+        assert np.isclose(stats.social_std()[b], social[present, b].std())
+    assert np.allclose(stats.average_agents(), 1)
+
+
+def test_bins_grow_with_new_degrees():
+    stats = DegreeStatistics()
+    stats.update(FixedSociety([0, 2], [0, 0.5], [0, 0.5]))
+    stats.update(FixedSociety([0, 1, 3], [0, 1, 0.25], [0, 1, 0.25]))
+    assert list(stats.samples) == [0, 2, 1]
+    assert list(stats.agents) == [0, 3, 3]
+    assert np.allclose(stats.coop_mean, [0, 0.75, 0.25])
+
+
+def test_labels():
+    assert DegreeStatistics().labels() == []
+    stats = DegreeStatistics(power_of_two_bins(20))
+    stats.grow(6)
+    assert list(power_of_two_bins(20)) == [0, 1, 2, 4, 8, 16]
+    assert stats.labels() == ['0', '1', '2-3', '4-7', '8-15', '16+']
+
+
+def test_power_of_two_bin_counts_match_agent_degrees():
+    society = Society(sim_data)
+    bin_edges = power_of_two_bins(sim_data["num_agents"])
+    counts, coop, social = society.degree_class_statistics(bin_edges)
+
+    classes = np.searchsorted(bin_edges, society.get_degrees(), side='right') - 1
+    assert list(counts) == list(np.bincount(classes, minlength=len(bin_edges)))
+    assert counts.sum() == len(society.agents)
+    for b in np.flatnonzero(counts):
+        assert np.isclose(social[b], society.get_social_value_array()[classes == b].mean())
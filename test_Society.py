@@ -0,0 +1,95 @@
+import math
+import random
+import numpy as np
+from Agent import Agent
+from Society import Society, random_k_out_network, random_undirected_network, scale_free_layout
+
+
+def check_k_out_network(num_agents, k):
+    neighbours = random_k_out_network(num_agents, k, np.random.default_rng(0))
+    assert neighbours.shape == (num_agents, k)
+    assert neighbours.min() >= 0 and neighbours.max() < num_agents
+    # no agent is its own neighbour and no neighbour is picked twice
+    assert not (neighbours == np.arange(num_agents)[:, None]).any()
+    ordered = np.sort(neighbours, axis=1)
+    assert not (ordered[:, 1:] == ordered[:, :-1]).any()
+
+
+def test_sparse_k_out_network():
+    check_k_out_network(1000, 20)
+
+
+def test_dense_k_out_network_finishes():
+    for k in [80, 100, 120, 250, 499]:
+        check_k_out_network(500, k)
+
+
+def test_undirected_network_links():
+    for num_agents, k in [(1000, 4), (50, 10), (20, 19)]:
+        first, second = random_undirected_network(num_agents, k, np.random.default_rng(0))
+        assert len(first) == len(second) == num_agents * k // 2
+        # every link is stored once as (first, second) with second < first, so there are no self links
+        assert (second < first).all()
+        assert second.min() >= 0 and first.max() < num_agents
+        assert len(set(zip(first.tolist(), second.tolist()))) == len(first)
+
+
+sim_data = {
+    "actions": ['C', 'D'],
+    "exploration_rate": 1.0,
+    "exploration_decay": 0.99,
+    "exploration_update": False,
+    "initial_social_value": 0.5,
+    "random_social_value": False,
+    "std_dev": 0.1,
+    "social_adjustment": 1,
+    "social_step_size": 0.1,
+}
+
+
+def recursive_layout(agent, radius, base_orientation, positions):
+    """depth first layout the scale free setup used before scale_free_layout, kept to compare against"""
+    unpositioned = [x for x in agent.neighbours if id(x) not in positions]
+    theta_step = 2 * math.pi / len(agent.neighbours)
+    radii = []
+    for i, neighbour in enumerate(unpositioned):
+        theta = base_orientation + i * theta_step
+        radii.append(radius * len(neighbour.neighbours) / len(agent.neighbours))
+        x, y = positions[id(agent)]
+        positions[id(neighbour)] = (x + radii[i] * math.sin(theta), y + radii[i] * math.cos(theta))
+    for i, neighbour in enumerate(unpositioned):
+        recursive_layout(neighbour, radii[i] * 0.8, base_orientation + i * theta_step, positions)
+
+
+def test_scale_free_layout_matches_recursive_layout_on_trees():
+    for seed in range(5):
+        rng = random.Random(seed)
+        agents = [Agent(sim_data) for _ in range(300)]
+        # preferential attachment with one link per agent creates a tree
+        targets = [0]
+        for i in range(1, len(agents)):
+            j = rng.choice(targets)
+            Society.set_neighbours(agents[i], agents[j])
+            targets += [i, j]
+        agents.sort(key=lambda x: len(x.neighbours), reverse=True)
+
+        xs, ys = scale_free_layout(agents, 500, (500, 500))
+        positions = {id(agents[0]): (500, 500)}
+        recursive_layout(agents[0], 500, 0, positions)
+        expected = np.array([positions[id(agent)] for agent in agents])
+        assert np.allclose(xs, expected[:, 0], atol=1e-9)
+        assert np.allclose(ys, expected[:, 1], atol=1e-9)
+
+
+def test_undirected_society_leaves_no_agent_isolated():
+    data = dict(sim_data, width=1000, height=1000, num_agents=200, learning_rate=0.01, num_neighbours=1,
+                update_social_values=False, grid_size=20, grid_setup=False, scale_free_setup=False,
+                scale_free_links=1, undirected_random=True, headless=True)
+    for seed in range(5):
+        society = Society(dict(data, network_seed=seed))
+        for agent in society.agents:
+            assert len(agent.neighbours) > 0
+            assert agent not in agent.neighbours
+            assert len(set(map(id, agent.neighbours))) == len(agent.neighbours)
+            # links are undirected
+            assert all(agent in neighbour.neighbours for neighbour in agent.neighbours)